@@ -12,8 +12,12 @@ import logging
 from pathlib import Path
 from datetime import datetime
 import json
-from typing import Dict, Any, List
+import base64
+from typing import TYPE_CHECKING, Dict, Any, List
 import re
+import time
+import hashlib
+import tempfile
 
 # Setup logging
 logging.basicConfig(
@@ -22,6 +26,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_API_KEY_RE = re.compile(r'<meta name="gemini-api-key" content="([^"]+)"')
+_HTML_BLOCK_RE = re.compile(r'```html\n([\s\S]*?)\n```')
+_HTML_ANY_RE = re.compile(r'```\n([\s\S]*?)\n```')
+
 # Load API key: env var first (RunPod / production), then index.html (local dev)
 def load_api_key():
     key = os.environ.get("GOOGLE_AI_STUDIO_API_KEY") or os.environ.get("GEMINI_API_KEY")
@@ -30,7 +38,7 @@ def load_api_key():
     html_path = Path(__file__).parent / "index.html"
     if html_path.exists():
         content = html_path.read_text()
-        match = re.search(r'<meta name="gemini-api-key" content="([^"]+)"', content)
+        match = _API_KEY_RE.search(content)
         if match:
             return match.group(1)
     return None
@@ -47,42 +55,398 @@ _repo = Path(__file__).resolve().parent
 sys.path.insert(0, str(_repo))
 sys.path.insert(0, str(_repo.parent / "match-me" / "TheGeminiLoop"))
 
-from google import genai
-from google.genai.types import Content, Part, Blob
+# google-genai is imported on first use (_get_genai_client and friends): it is the
+# slowest import here and the usage/error paths never need it.
+if TYPE_CHECKING:
+    from google.genai.types import GenerateContentConfig
+from pydantic import BaseModel
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def _json_loads(data):
+    """Parse JSON from str/bytes, using orjson when installed."""
+    return orjson.loads(data) if HAS_ORJSON else json.loads(data)
+
+
+def _json_dumps(obj, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes, using orjson when installed."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode()
+
+# Components evaluated concurrently. Browser work is serialized on the single MCP
+# page (see ModuleEvaluator._browser_lock); only the Gemini round trips overlap.
+EVAL_CONCURRENCY = int(os.environ.get("EVAL_CONCURRENCY", "4"))
+# Gemini bills an image by tiles and downsamples large ones server-side anyway;
+# shrinking full-page screenshots first cuts upload bytes without losing signal.
+SCREENSHOT_MAX_SIDE = int(os.environ.get("EVAL_SCREENSHOT_MAX_SIDE", "768"))
+SCREENSHOT_JPEG_QUALITY = 85
+# Swap components inside an already-loaded module-viewer.html (history.pushState +
+# 'navigate-module' event) instead of a full page load. Opt-in: timers and globals
+# left behind by the previous component survive a soft navigation.
+SOFT_NAVIGATION = os.environ.get("EVAL_SOFT_NAV", "0") == "1"
+# Screenshots are captured in memory; "all" also persists every frame (RunPod
+# artifacts, fix loop), "failed" only writes frames for components that fail.
+SAVE_SCREENSHOTS = os.environ.get("EVAL_SAVE_SCREENSHOTS", "all")
+# Verdicts are reused for unchanged components (same HTML, same-looking screenshots)
+VERDICT_CACHE_DIR = Path("evaluation_results/.cache")
+VERDICT_CACHE_TTL = 7 * 24 * 3600
+
+
+
+class ComponentVerdict(BaseModel):
+    """Response schema for the vision evaluation; Gemini is constrained to emit exactly this JSON."""
+    score: int
+    feedback: str
+    issues: List[str]
+    unnecessary_elements: List[str]
+    ui_improvements: List[str]
+
 
+# Static rubrics, sent as the system instruction so each request only carries the
+# per-step interaction log, context and screenshots.
+INTERACTIVE_RUBRIC = """Evaluate this educational component. The screenshots show it before and after interactions.
+
+Rate it 0-100 based on these simple criteria:
+
+1. **Does it work?** (30 pts)
+   - Buttons/sliders respond
+   - Shows visual changes when interacted with
+   - Not broken or crashing
+
+2. **Is it usable?** (30 pts)
+   - Layout makes sense
+   - Clear what to do
+   - Feedback appears when you interact
+
+3. **Looks reasonable?** (20 pts)
+   - Not ugly or confusing
+   - Colors/text are readable
+   - Organized layout
+
+4. **Teaches the concept?** (20 pts)
+   - Helps students understand
+   - Interactive learning happens
+
+**Scoring:**
+- 0-60: Broken (doesn't work)
+- 61-74: Works but poor UX
+- 75+: Good (works, usable, makes sense)
+
+Respond in JSON:
+{
+    "score": <0-100>,
+    "feedback": "<brief assessment>",
+    "issues": ["<major issue>"],
+    "unnecessary_elements": [],
+    "ui_improvements": []
+}"""
+
+DIAGRAM_RUBRIC = """Evaluate this SVG diagram. Rate 0-100:
+- Clarity and readability
+- Educational value
+- Visual quality
+
+Respond in JSON:
+{
+    "score": <0-100>,
+    "feedback": "<brief assessment>",
+    "issues": ["<issue if any>"]
+}"""
+
+# Opt-in micro-batching of vision verdicts: up to VISION_BATCH_SIZE components that
+# arrive within VISION_BATCH_WINDOW seconds share one request (fewer requests per
+# minute under tight rate limits, at the cost of some latency). 1 disables it.
+VISION_BATCH_SIZE = int(os.environ.get("EVAL_VISION_BATCH_SIZE", "1"))
+VISION_BATCH_WINDOW = float(os.environ.get("EVAL_VISION_BATCH_WINDOW", "5"))
+
+AUTO_FIX_INSTRUCTIONS = """
+**CRITICAL INSTRUCTIONS:**
+1. PRESERVE all working interactive elements (sliders, buttons, inputs)
+2. PRESERVE all JavaScript functionality that works
+3. ONLY fix the specific issues mentioned above
+4. If interactions work, do not change the JS logic
+5. Focus on fixing: styling, colors, spacing, feedback text, layout
+6. Keep the component self-contained (inline CSS/JS)
+7. Return COMPLETE working HTML (do not remove anything functional)
+
+Generate the COMPLETE fixed HTML. Return ONLY the HTML code, no explanations."""
+
+# One client (and so one keep-alive HTTP connection pool) shared by every step,
+# verdict requests and auto-fix; closed once in ModuleEvaluator.close().
 _genai_client = None
 
 def _get_genai_client():
     global _genai_client
     if _genai_client is None:
+        from google import genai
         _genai_client = genai.Client(api_key=api_key) if api_key else genai.Client()
     return _genai_client
 
 
+async def _close_genai_client():
+    """Release the shared client's pooled connections (no-op on SDKs without aclose)."""
+    global _genai_client
+    client, _genai_client = _genai_client, None
+    if client is None:
+        return
+    aclose = getattr(client.aio, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+def _load_screenshot(source):
+    """Open a screenshot (path or encoded bytes) and downscale it to fit SCREENSHOT_MAX_SIDE."""
+    import io
+    import PIL.Image
+    img = PIL.Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    original_size = img.size
+    img.draft("RGB", (SCREENSHOT_MAX_SIDE, SCREENSHOT_MAX_SIDE))
+    img.thumbnail((SCREENSHOT_MAX_SIDE, SCREENSHOT_MAX_SIDE), PIL.Image.Resampling.LANCZOS)
+    img.info["downscaled"] = img.size != original_size
+    return img
+
+
+def _write_atomic(path: Path, data: bytes):
+    """Write data to path via a temp file + os.replace so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _write_screenshots(captures):
+    """Persist (path, bytes) screenshot captures to disk."""
+    for path, data in captures:
+        path.write_bytes(data)
+
+
+def _is_blank(img, min_stddev: float = 5.0) -> bool:
+    """True if the image is (near) uniform, i.e. grayscale stddev below min_stddev."""
+    import PIL.ImageStat
+    return PIL.ImageStat.Stat(img.convert("L")).stddev[0] < min_stddev
+
+
+def _dhash(img) -> int:
+    """64-bit difference hash: 9x8 grayscale, one bit per left/right brightness comparison."""
+    import PIL.Image
+    small = img.convert("L").resize((9, 8), PIL.Image.Resampling.BILINEAR)
+    px = list(small.getdata())
+    h = 0
+    for row in range(8):
+        for col in range(8):
+            h = (h << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return h
+
+
+def _first_json_object(text):
+    """Decode the first balanced top-level {...} in text, or None if it is incomplete/invalid."""
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                try:
+                    return _json_loads(text[start:i + 1])
+                except json.JSONDecodeError:
+                    return None
+    return None
+
+
 class ModuleEvaluator:
     """Evaluates individual module components using direct browser automation"""
     
-    def __init__(self, headless=False):
+    def __init__(self, headless=False, use_cache=True):
         self.headless = headless
+        self.use_cache = use_cache
         self.mcp = None
         self._genai_model = "models/gemini-3-flash-preview"
+        # rubric text -> GenerateContentConfig carrying it as system_instruction
+        self._verdict_configs: Dict[str, "GenerateContentConfig"] = {}
+        self._sem = asyncio.Semaphore(EVAL_CONCURRENCY)
+        self._browser_lock = asyncio.Lock()
+        self._last_url_base = None  # page currently loaded in the browser, without query
+        self._nav_seq = 0  # per-navigation nonce appended to component URLs
+        # module_id -> (mtime, parsed manifest)
+        self._manifest_cache: Dict[str, tuple] = {}
+        # rubric -> pending (prompt, images, future) verdict requests, and their flush timers
+        self._batch_pending: Dict[str, list] = {}
+        self._batch_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._batch_tasks = set()
+        # blake2b(verdict key + exact screenshot bytes) -> verdict, for this process
+        self._vision_cache: Dict[str, Dict[str, Any]] = {}
 
-    def _call_gemini(self, content_list):
-        """Call Gemini with list of parts (str and/or PIL Images). Returns response with .text."""
+    def _build_contents(self, content_list):
+        """Convert a list of str / PIL Images into google.genai Content."""
         import io
-        client = _get_genai_client()
+        from google.genai.types import Content, Part, Blob
         parts = []
         for item in content_list:
             if isinstance(item, str):
                 parts.append(Part(text=item))
+            elif isinstance(item, bytes):
+                # Already-encoded JPEG (e.g. a frame that needed no downscale): send as-is
+                parts.append(Part(inline_data=Blob(data=item, mime_type="image/jpeg")))
             else:
-                # PIL Image: Part expects inline_data (Blob), not value
+                # PIL Image: Part expects inline_data (Blob), not value. JPEG is far
+                # smaller than PNG for screenshots and reads the same to the model.
+                # convert() always copies, so only call it when the mode needs changing.
                 buf = io.BytesIO()
-                item.save(buf, format="PNG")
-                parts.append(Part(inline_data=Blob(data=buf.getvalue(), mime_type="image/png")))
-        contents = [Content(parts=parts)]
-        return client.models.generate_content(model=self._genai_model, contents=contents)
+                img = item if item.mode == "RGB" else item.convert("RGB")
+                img.save(buf, format="JPEG", quality=SCREENSHOT_JPEG_QUALITY)
+                parts.append(Part(inline_data=Blob(data=buf.getvalue(), mime_type="image/jpeg")))
+        return [Content(parts=parts)]
+
+    async def _call_gemini(self, content_list):
+        """Call Gemini with list of parts (str and/or PIL Images). Returns response with .text."""
+        client = _get_genai_client()
+        contents = await asyncio.to_thread(self._build_contents, content_list)
+        return await client.aio.models.generate_content(model=self._genai_model, contents=contents)
+
+    def _verdict_config(self, rubric: str) -> "GenerateContentConfig":
+        """Build (once per rubric) the JSON-schema config carrying the rubric.
+        
+        The rubric goes in system_instruction. It is far below the minimum size of an
+        explicit context cache, so caching it would only add a failing API call.
+        """
+        config = self._verdict_configs.get(rubric)
+        if config is None:
+            from google.genai.types import GenerateContentConfig
+            config = self._verdict_configs[rubric] = GenerateContentConfig(
+                system_instruction=rubric,
+                response_mime_type="application/json",
+                response_schema=ComponentVerdict,
+            )
+        return config
+
+    async def _stream_gemini_json(self, content_list, rubric: str):
+        """Stream a Gemini response and stop as soon as a complete JSON object has arrived.
+        
+        Returns (text, parsed) where parsed is None if no object could be decoded.
+        """
+        client = _get_genai_client()
+        config = self._verdict_config(rubric)
+        contents = await asyncio.to_thread(self._build_contents, content_list)
+        text = ""
+        stream = await client.aio.models.generate_content_stream(
+            model=self._genai_model,
+            contents=contents,
+            config=config,
+        )
+        async for chunk in stream:
+            text += chunk.text or ""
+            if "}" in (chunk.text or ""):
+                parsed = _first_json_object(text)
+                if parsed is not None:
+                    await stream.aclose()
+                    return text, parsed
+        return text, None
+        
+    async def _judge(self, prompt: str, images: list, rubric: str):
+        """Get (text, parsed verdict) for one component, micro-batched if enabled."""
+        if VISION_BATCH_SIZE <= 1:
+            return await self._stream_gemini_json([prompt] + images, rubric)
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._batch_pending.setdefault(rubric, [])
+        pending.append((prompt, images, future))
+        if len(pending) >= VISION_BATCH_SIZE:
+            self._flush_batch(rubric)
+        elif len(pending) == 1:
+            self._batch_timers[rubric] = loop.call_later(VISION_BATCH_WINDOW, self._flush_batch, rubric)
+        return await future
+
+    def _flush_batch(self, rubric: str):
+        """Send whatever is pending for rubric as one batch."""
+        timer = self._batch_timers.pop(rubric, None)
+        if timer:
+            timer.cancel()
+        items = self._batch_pending.pop(rubric, [])
+        if items:
+            task = asyncio.create_task(self._run_batch(items, rubric))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, items: list, rubric: str):
+        """Resolve a batch with one request; fall back to per-component calls on any mismatch."""
+        verdicts = None
+        if len(items) > 1:
+            try:
+                verdicts = await self._batch_verdicts(items, rubric)
+            except Exception as e:
+                logger.warning(f"⚠️  Batched evaluation failed ({e}); evaluating individually")
+        
+        async def resolve(k, prompt, images, future):
+            try:
+                if verdicts is not None:
+                    future.set_result((json.dumps(verdicts[k]), verdicts[k]))
+                else:
+                    future.set_result(await self._stream_gemini_json([prompt] + images, rubric))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
         
+        await asyncio.gather(*(resolve(k, *item) for k, item in enumerate(items)))
+
+    async def _batch_verdicts(self, items: list, rubric: str):
+        """One request for several components; returns a list of verdicts or None."""
+        n = len(items)
+        logger.info(f"📦 Evaluating {n} components in one Gemini request")
+        config = self._verdict_config(rubric).model_copy(
+            update={"response_schema": list[ComponentVerdict]}
+        )
+        content = [
+            f"Evaluate each of the {n} components below independently, applying the rubric to each one. "
+            f"Respond with a JSON array of exactly {n} verdicts, in the same order."
+        ]
+        for k, (prompt, images, _) in enumerate(items):
+            content.append(f"\n## Component {k + 1}\n{prompt}")
+            content.extend(images)
+        contents = await asyncio.to_thread(self._build_contents, content)
+        response = await _get_genai_client().aio.models.generate_content(
+            model=self._genai_model, contents=contents, config=config
+        )
+        verdicts = _json_loads(response.text)
+        if not isinstance(verdicts, list) or len(verdicts) != n:
+            logger.warning(f"⚠️  Batched evaluation returned {len(verdicts) if isinstance(verdicts, list) else 'no'} verdicts for {n} components")
+            return None
+        return verdicts
+
+    def _load_manifest(self, module_id: str) -> Dict[str, Any]:
+        """Return the parsed manifest for a module, re-reading only when its mtime changes."""
+        manifest_path = Path(f"modules/{module_id}/manifest.json")
+        mtime = manifest_path.stat().st_mtime
+        cached = self._manifest_cache.get(module_id)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        manifest = _json_loads(manifest_path.read_bytes())
+        self._manifest_cache[module_id] = (mtime, manifest)
+        return manifest
+
     async def connect(self):
         """Initialize browser-use client"""
         try:
@@ -116,11 +480,14 @@ class ModuleEvaluator:
         question_index: int = 0,
         module_version: str = "1.0",
         step_explanation: str = None,
-        input_label: str = None
+        input_label: str = None,
+        create_dir: bool = True
     ) -> Dict[str, Any]:
         """
         Evaluate a single component using browser automation + Gemini vision
         
+        create_dir=False skips the mkdir when the caller already created screenshots_dir.
+        
         Returns:
             {
                 "score": int (0-100),
@@ -134,198 +501,42 @@ class ModuleEvaluator:
         logger.info(f"📊 Evaluating {module_id} - Step {step_index + 1} ({component_type})")
         logger.info(f"{'='*70}\n")
         
-        screenshots_dir.mkdir(parents=True, exist_ok=True)
-        screenshots = []
-        interaction_log = []
+        if create_dir:
+            screenshots_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Component HTML (handle v2.0 multi-question naming)
+        if module_version == "2.0":
+            component_filename = f"q{question_index + 1}-step-{step_index}.html"
+        else:
+            component_filename = f"step-{step_index}.html"
+        component_path = Path(f"modules/{module_id}/components/{component_filename}")
         
         try:
-            # Navigate to component
-            logger.info(f"🌐 Navigating to: {url}")
-            try:
-                await self.mcp.call_tool("browser_evaluate", {
-                    "expression": f"window.location.href = '{url}'"
-                })
-                await asyncio.sleep(4)
-                logger.info("✅ Component loaded")
-            except Exception as nav_err:
-                logger.error(f"❌ Navigation failed: {nav_err}")
-                raise Exception(f"Browser closed or navigation failed: {nav_err}")
+            component_bytes = component_path.read_bytes() if component_path.exists() else b""
             
-            # Take initial screenshot
-            screenshot_path = screenshots_dir / "initial.png"
-            try:
-                logger.info(f"Taking screenshot: {screenshot_path}")
-                await self.mcp.call_tool("browser_take_screenshot", {
-                    "fullPage": True,
-                    "filename": str(screenshot_path)
-                })
-                screenshots.append(screenshot_path)
-                logger.info(f"📸 Initial screenshot")
-                interaction_log.append("Initial state captured")
-            except Exception as ss_err:
-                logger.error(f"Screenshot failed: {ss_err}")
-                raise Exception(f"Browser closed or screenshot failed: {ss_err}")
-            
-            # If interactive, test the elements
-            if component_type == "interactive":
-                logger.info("🎮 Testing interactive elements...")
-                
-                # Test sliders
-                sliders = await self.mcp.call_tool("browser_evaluate", {
-                    "expression": """
-                        Array.from(document.querySelectorAll('input[type="range"]')).map((s, i) => ({
-                            index: i,
-                            min: parseFloat(s.min) || 0,
-                            max: parseFloat(s.max) || 100,
-                            value: parseFloat(s.value) || 0
-                        }))
-                    """
-                })
-                
-                sliders = sliders.get("result", []) if isinstance(sliders, dict) else sliders or []
-                
-                if sliders:
-                    logger.info(f"   Found {len(sliders)} slider(s)")
-                    for i, slider in enumerate(sliders[:3]):
-                        mid = (slider['min'] + slider['max']) / 2
-                        await self.mcp.call_tool("browser_evaluate", {
-                            "expression": f"""
-                                (function() {{
-                                    const s = document.querySelectorAll('input[type="range"]')[{i}];
-                                    if (s) {{
-                                        s.value = {mid};
-                                        s.dispatchEvent(new Event('input', {{ bubbles: true }}));
-                                        s.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                                    }}
-                                }})()
-                            """
-                        })
-                        await asyncio.sleep(1)
-                        logger.info(f"   ✓ Moved slider {i+1} to {mid}")
-                        interaction_log.append(f"Moved slider {i+1} to value {mid}")
-                    
-                    screenshot_path = screenshots_dir / "after_sliders.png"
-                    try:
-                        logger.info(f"Taking screenshot: {screenshot_path}")
-                        await self.mcp.call_tool("browser_take_screenshot", {
-                            "fullPage": True,
-                            "filename": str(screenshot_path)
-                        })
-                        screenshots.append(screenshot_path)
-                        logger.info("   📸 Screenshot after sliders")
-                    except Exception as ss_err:
-                        logger.error(f"Screenshot failed: {ss_err}")
-                        raise Exception(f"Browser closed during interaction: {ss_err}")
-                
-                # Test inputs
-                inputs = await self.mcp.call_tool("browser_evaluate", {
-                    "expression": """
-                        Array.from(document.querySelectorAll('input[type="text"], input[type="number"]')).map((inp, i) => ({
-                            index: i,
-                            type: inp.type
-                        }))
-                    """
-                })
-                
-                inputs = inputs.get("result", []) if isinstance(inputs, dict) else inputs or []
-                
-                if inputs:
-                    logger.info(f"   Found {len(inputs)} input(s)")
-                    for i, inp in enumerate(inputs[:3]):
-                        test_val = "5" if inp['type'] == 'number' else "test"
-                        await self.mcp.call_tool("browser_evaluate", {
-                            "expression": f"""
-                                (function() {{
-                                    const inp = document.querySelectorAll('input[type="text"], input[type="number"]')[{i}];
-                                    if (inp) {{
-                                        inp.value = '{test_val}';
-                                        inp.dispatchEvent(new Event('input', {{ bubbles: true }}));
-                                        inp.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                                    }}
-                                }})()
-                            """
-                        })
-                        await asyncio.sleep(1)
-                        logger.info(f"   ✓ Typed '{test_val}' in input {i+1}")
-                        interaction_log.append(f"Typed '{test_val}' in input {i+1}")
-                    
-                    screenshot_path = screenshots_dir / "after_inputs.png"
-                    try:
-                        logger.info(f"Taking screenshot: {screenshot_path}")
-                        await self.mcp.call_tool("browser_take_screenshot", {
-                            "fullPage": True,
-                            "filename": str(screenshot_path)
-                        })
-                        screenshots.append(screenshot_path)
-                        logger.info("   📸 Screenshot after inputs")
-                    except Exception as ss_err:
-                        logger.error(f"Screenshot failed: {ss_err}")
-                        raise Exception(f"Browser closed during interaction: {ss_err}")
-                
-                # Test buttons
-                buttons = await self.mcp.call_tool("browser_evaluate", {
-                    "expression": """
-                        Array.from(document.querySelectorAll('button')).map((btn, i) => ({
-                            index: i,
-                            text: btn.textContent.trim().substring(0, 30)
-                        }))
-                    """
-                })
-                
-                buttons = buttons.get("result", []) if isinstance(buttons, dict) else buttons or []
-                
-                if buttons:
-                    logger.info(f"   Found {len(buttons)} button(s)")
-                    for i, btn in enumerate(buttons[:2]):
-                        await self.mcp.call_tool("browser_evaluate", {
-                            "expression": f"""
-                                (function() {{
-                                    const btn = document.querySelectorAll('button')[{i}];
-                                    if (btn) btn.click();
-                                }})()
-                            """
-                        })
-                        await asyncio.sleep(1)
-                        logger.info(f"   ✓ Clicked button '{btn['text']}'")
-                        interaction_log.append(f"Clicked button '{btn['text']}'")
-                    
-                    screenshot_path = screenshots_dir / "after_buttons.png"
-                    try:
-                        logger.info(f"Taking screenshot: {screenshot_path}")
-                        await self.mcp.call_tool("browser_take_screenshot", {
-                            "fullPage": True,
-                            "filename": str(screenshot_path)
-                        })
-                        screenshots.append(screenshot_path)
-                        logger.info("   📸 Screenshot after buttons")
-                    except Exception as ss_err:
-                        logger.error(f"Screenshot failed: {ss_err}")
-                        raise Exception(f"Browser closed during interaction: {ss_err}")
-                
-                # If no sliders/inputs/buttons (e.g. drag-and-drop only), we only have initial screenshot.
-                # Take a second screenshot after a short delay so Gemini gets at least two frames.
-                if len(screenshots) == 1:
-                    await asyncio.sleep(2)
-                    screenshot_path = screenshots_dir / "after_delay.png"
-                    try:
-                        logger.info(f"   No sliders/inputs/buttons; taking second frame: {screenshot_path}")
-                        await self.mcp.call_tool("browser_take_screenshot", {
-                            "fullPage": True,
-                            "filename": str(screenshot_path)
-                        })
-                        screenshots.append(screenshot_path)
-                        interaction_log.append("Second frame captured (no standard controls to interact with)")
-                    except Exception as ss_err:
-                        logger.warning(f"Second screenshot failed: {ss_err}")
+            # One page is shared by all concurrent evaluations: hold it for the whole
+            # navigate/interact/screenshot sequence, release it before calling Gemini.
+            async with self._browser_lock:
+                captures, interaction_log = await self._capture_component(
+                    url, component_type, screenshots_dir
+                )
+            screenshots = [path for path, _ in captures]
+            
+            # Write frames to disk off-loop while Gemini evaluates them from memory
+            persist = None
+            if SAVE_SCREENSHOTS == "all":
+                persist = asyncio.create_task(asyncio.to_thread(_write_screenshots, captures))
             
             # Evaluate with Gemini vision
             logger.info("🔍 Evaluating with Gemini vision...")
-            result = await self._evaluate_with_gemini(
+            result, images = await self._evaluate_with_gemini(
                 component_type=component_type,
                 screenshots=screenshots,
+                screenshot_data=[data for _, data in captures],
                 interaction_log=interaction_log,
                 step_explanation=step_explanation,
-                input_label=input_label
+                input_label=input_label,
+                cache_salt=hashlib.blake2b(component_bytes, digest_size=16).hexdigest()
             )
             
             # Process result
@@ -335,34 +546,33 @@ class ModuleEvaluator:
             unnecessary_elements = result.get('unnecessary_elements', [])
             ui_improvements = result.get('ui_improvements', [])
             
+            # Failing frames are always kept (fix loop + debugging)
+            if persist is not None:
+                await persist
+            elif not passed:
+                await asyncio.to_thread(_write_screenshots, captures)
+            else:
+                screenshots = []
+            
             # Generate fix prompt with HTML if has issues
             fix_prompt = None
             fixed_html = None
             
             if not passed or issues or unnecessary_elements or ui_improvements:
-                # Load the current HTML (handle v2.0 multi-question naming)
-                if module_version == "2.0":
-                    component_filename = f"q{question_index + 1}-step-{step_index}.html"
-                else:
-                    component_filename = f"step-{step_index}.html"
-                
-                component_path = Path(f"modules/{module_id}/components/{component_filename}")
-                current_html = component_path.read_text() if component_path.exists() else None
+                current_html = component_bytes.decode() if component_bytes else None
                 
                 if current_html:
                     # Load manifest for educational context
                     question_context = None
                     try:
-                        manifest_path = Path(f"modules/{module_id}/manifest.json")
-                        if manifest_path.exists():
-                            import json
-                            with open(manifest_path) as f:
-                                manifest = json.load(f)
-                            
-                            # Get question text
-                            if manifest.get("questions") and question_index < len(manifest["questions"]):
-                                q = manifest["questions"][question_index]
-                                question_context = q.get("question", "")
+                        manifest = self._load_manifest(module_id)
+                        
+                        # Get question text
+                        if manifest.get("questions") and question_index < len(manifest["questions"]):
+                            q = manifest["questions"][question_index]
+                            question_context = q.get("question", "")
+                    except FileNotFoundError:
+                        pass
                     except Exception as e:
                         logger.warning(f"Could not load manifest context: {e}")
                     
@@ -387,7 +597,7 @@ class ModuleEvaluator:
                         fixed_html = await self._auto_fix_component(
                             fix_prompt=fix_prompt,
                             current_html=current_html,
-                            screenshots=screenshots
+                            screenshots=images
                         )
                         
                         if fixed_html:
@@ -428,22 +638,297 @@ class ModuleEvaluator:
                 "step_index": step_index
             }
     
+    async def _wait_ready(self, nonce: int, timeout: float = 6.0) -> bool:
+        """Poll until the page loaded with ?_eval=nonce has finished loading.
+        
+        Replaces the old fixed 4s post-navigation sleep. The nonce is unique to each
+        navigation (see _capture_component), so the previous document never matches;
+        only that parameter is compared, so browser URL normalization doesn't matter.
+        Returns False on timeout.
+        """
+        expression = f"""
+            document.readyState === 'complete'
+                && new URL(window.location.href).searchParams.get('_eval') === {json.dumps(str(nonce))}
+                && window.__moduleViewerReady !== false
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            try:
+                ready = await self.mcp.call_tool("browser_evaluate", {"expression": expression})
+                if isinstance(ready, dict) and ready.get("result") is True:
+                    return True
+            except Exception:
+                pass  # Page may be mid-navigation; try again
+            await asyncio.sleep(0.1)
+        return False
+    
+    async def _take_screenshot(self) -> bytes:
+        """Full-page JPEG screenshot, returned as bytes (nothing is written to disk)."""
+        result = await self.mcp.call_tool("browser_take_screenshot", {
+            "fullPage": True,
+            "return_base64": True,
+            "type": "jpeg",
+            "quality": SCREENSHOT_JPEG_QUALITY
+        })
+        data = (result.get("result") or {}).get("base64") if isinstance(result, dict) else None
+        if not data:
+            raise Exception(result.get("error") if isinstance(result, dict) else "no screenshot data")
+        return base64.b64decode(data)
+    
+    async def _capture_component(
+        self,
+        url: str,
+        component_type: str,
+        screenshots_dir: Path
+    ):
+        """Navigate to the component, exercise its controls and take screenshots.
+        
+        Returns (captures, interaction_log) where captures is a list of (path, jpeg bytes);
+        nothing is written yet. Caller must hold self._browser_lock.
+        """
+        screenshots = []
+        interaction_log = []
+        
+        # Navigate to component. The nonce makes the target URL unique, so re-evaluating
+        # the same component after a fix can't mistake the old document for the new one.
+        logger.info(f"🌐 Navigating to: {url}")
+        url_base = url.split("?", 1)[0]
+        self._nav_seq += 1
+        url = f"{url}{'&' if '?' in url else '?'}_eval={self._nav_seq}"
+        if SOFT_NAVIGATION and url_base == self._last_url_base:
+            expression = f"""
+                window.__moduleViewerSoftNav
+                    ? window.dispatchEvent(new CustomEvent('navigate-module', {{ detail: {{ url: {json.dumps(url)} }} }}))
+                    : (window.location.href = {json.dumps(url)})
+            """
+        else:
+            expression = f"window.location.href = {json.dumps(url)}"
+        try:
+            self._last_url_base = None
+            await self.mcp.call_tool("browser_evaluate", {"expression": expression})
+            await asyncio.sleep(0.2)
+            if await self._wait_ready(self._nav_seq):
+                self._last_url_base = url_base
+                logger.info("✅ Component loaded")
+            else:
+                logger.warning("⚠️  Component not ready after timeout, continuing anyway")
+        except Exception as nav_err:
+            logger.error(f"❌ Navigation failed: {nav_err}")
+            raise Exception(f"Browser closed or navigation failed: {nav_err}")
+        
+        # Take initial screenshot
+        screenshot_path = screenshots_dir / "initial.jpg"
+        try:
+            logger.info(f"Taking screenshot: {screenshot_path}")
+            screenshots.append((screenshot_path, await self._take_screenshot()))
+            logger.info("📸 Initial screenshot")
+            interaction_log.append("Initial state captured")
+        except Exception as ss_err:
+            logger.error(f"Screenshot failed: {ss_err}")
+            raise Exception(f"Browser closed or screenshot failed: {ss_err}")
+        
+        # If interactive, test the elements
+        if component_type == "interactive":
+            logger.info("🎮 Testing interactive elements...")
+            
+            # Discover sliders, inputs and buttons in a single round trip
+            controls = await self.mcp.call_tool("browser_evaluate", {
+                "expression": """
+                    ({
+                        sliders: Array.from(document.querySelectorAll('input[type="range"]')).map((s, i) => ({
+                            index: i,
+                            min: parseFloat(s.min) || 0,
+                            max: parseFloat(s.max) || 100,
+                            value: parseFloat(s.value) || 0
+                        })),
+                        inputs: Array.from(document.querySelectorAll('input[type="text"], input[type="number"]')).map((inp, i) => ({
+                            index: i,
+                            type: inp.type
+                        })),
+                        buttons: Array.from(document.querySelectorAll('button')).map((btn, i) => ({
+                            index: i,
+                            text: btn.textContent.trim().substring(0, 30)
+                        }))
+                    })
+                """
+            })
+            
+            controls = controls.get("result") if isinstance(controls, dict) else controls
+            controls = controls or {}
+            sliders = controls.get("sliders") or []
+            inputs = controls.get("inputs") or []
+            buttons = controls.get("buttons") or []
+            
+            # Test sliders
+            if sliders:
+                logger.info(f"   Found {len(sliders)} slider(s)")
+                mids = [(slider['min'] + slider['max']) / 2 for slider in sliders[:3]]
+                await self.mcp.call_tool("browser_evaluate", {
+                    "expression": f"""
+                        (function() {{
+                            const mids = {json.dumps(mids)};
+                            const ss = document.querySelectorAll('input[type="range"]');
+                            for (let i = 0; i < Math.min(mids.length, ss.length); i++) {{
+                                const s = ss[i];
+                                s.value = mids[i];
+                                s.dispatchEvent(new Event('input', {{ bubbles: true }}));
+                                s.dispatchEvent(new Event('change', {{ bubbles: true }}));
+                            }}
+                        }})()
+                    """
+                })
+                await asyncio.sleep(1)
+                for i, mid in enumerate(mids):
+                    logger.info(f"   ✓ Moved slider {i+1} to {mid}")
+                    interaction_log.append(f"Moved slider {i+1} to value {mid}")
+                
+                screenshot_path = screenshots_dir / "after_sliders.jpg"
+                try:
+                    logger.info(f"Taking screenshot: {screenshot_path}")
+                    screenshots.append((screenshot_path, await self._take_screenshot()))
+                    logger.info("   📸 Screenshot after sliders")
+                except Exception as ss_err:
+                    logger.error(f"Screenshot failed: {ss_err}")
+                    raise Exception(f"Browser closed during interaction: {ss_err}")
+            
+            # Test inputs
+            if inputs:
+                logger.info(f"   Found {len(inputs)} input(s)")
+                test_vals = ["5" if inp['type'] == 'number' else "test" for inp in inputs[:3]]
+                await self.mcp.call_tool("browser_evaluate", {
+                    "expression": f"""
+                        (function() {{
+                            const vals = {json.dumps(test_vals)};
+                            const els = document.querySelectorAll('input[type="text"], input[type="number"]');
+                            for (let i = 0; i < Math.min(vals.length, els.length); i++) {{
+                                const inp = els[i];
+                                inp.value = vals[i];
+                                inp.dispatchEvent(new Event('input', {{ bubbles: true }}));
+                                inp.dispatchEvent(new Event('change', {{ bubbles: true }}));
+                            }}
+                        }})()
+                    """
+                })
+                await asyncio.sleep(1)
+                for i, test_val in enumerate(test_vals):
+                    logger.info(f"   ✓ Typed '{test_val}' in input {i+1}")
+                    interaction_log.append(f"Typed '{test_val}' in input {i+1}")
+                
+                screenshot_path = screenshots_dir / "after_inputs.jpg"
+                try:
+                    logger.info(f"Taking screenshot: {screenshot_path}")
+                    screenshots.append((screenshot_path, await self._take_screenshot()))
+                    logger.info("   📸 Screenshot after inputs")
+                except Exception as ss_err:
+                    logger.error(f"Screenshot failed: {ss_err}")
+                    raise Exception(f"Browser closed during interaction: {ss_err}")
+            
+            # Test buttons
+            if buttons:
+                logger.info(f"   Found {len(buttons)} button(s)")
+                clicked = buttons[:2]
+                await self.mcp.call_tool("browser_evaluate", {
+                    "expression": f"""
+                        (function() {{
+                            const btns = document.querySelectorAll('button');
+                            for (let i = 0; i < Math.min({len(clicked)}, btns.length); i++) {{
+                                btns[i].click();
+                            }}
+                        }})()
+                    """
+                })
+                await asyncio.sleep(1)
+                for btn in clicked:
+                    logger.info(f"   ✓ Clicked button '{btn['text']}'")
+                    interaction_log.append(f"Clicked button '{btn['text']}'")
+                
+                screenshot_path = screenshots_dir / "after_buttons.jpg"
+                try:
+                    logger.info(f"Taking screenshot: {screenshot_path}")
+                    screenshots.append((screenshot_path, await self._take_screenshot()))
+                    logger.info("   📸 Screenshot after buttons")
+                except Exception as ss_err:
+                    logger.error(f"Screenshot failed: {ss_err}")
+                    raise Exception(f"Browser closed during interaction: {ss_err}")
+            
+            # If no sliders/inputs/buttons (e.g. drag-and-drop only), we only have initial screenshot.
+            # Take a second screenshot after a short delay so Gemini gets at least two frames.
+            if len(screenshots) == 1:
+                await asyncio.sleep(2)
+                screenshot_path = screenshots_dir / "after_delay.jpg"
+                try:
+                    logger.info(f"   No sliders/inputs/buttons; taking second frame: {screenshot_path}")
+                    screenshots.append((screenshot_path, await self._take_screenshot()))
+                    interaction_log.append("Second frame captured (no standard controls to interact with)")
+                except Exception as ss_err:
+                    logger.warning(f"Second screenshot failed: {ss_err}")
+        
+        return screenshots, interaction_log
+    
     async def _evaluate_with_gemini(
         self,
         component_type: str,
         screenshots: List[Path],
         interaction_log: List[str],
         step_explanation: str = None,
-        input_label: str = None
-    ) -> Dict[str, Any]:
-        """Evaluate using Gemini vision"""
-        import PIL.Image
+        input_label: str = None,
+        cache_salt: str = "",
+        screenshot_data: List[bytes] = None
+    ) -> tuple:
+        """Evaluate using Gemini vision. Returns (result, images) where images are the
+        decoded, de-duplicated PIL frames that were (or would have been) sent.
+        
+        screenshot_data, if given, holds the encoded frames for screenshots (same order)
+        so they are decoded from memory instead of read back from disk.
+        
+        cache_salt identifies the component source (e.g. a hash of its HTML); together
+        with the screenshot dHashes and prompt inputs it keys the on-disk verdict cache.
+        """
+        # Load all screenshots (downscaled, see SCREENSHOT_MAX_SIDE). PIL releases the
+        # GIL while decoding/resizing, so this runs in parallel off the event loop.
+        sources = screenshot_data or screenshots
+        images = await asyncio.gather(*(asyncio.to_thread(_load_screenshot, src) for src in sources))
+        # Frames captured at or below SCREENSHOT_MAX_SIDE are sent as the captured JPEG
+        # bytes rather than re-encoded (see _build_contents)
+        payloads = [
+            src if isinstance(src, bytes) and not img.info.get("downscaled") else img
+            for src, img in zip(sources, images)
+        ]
+        
+        # A blank initial frame means the component failed to render: no need to ask Gemini
+        if images and _is_blank(images[0]):
+            logger.info("   ⬜ Initial screenshot is blank; skipping Gemini")
+            return {
+                "score": 0,
+                "feedback": "Component rendered a blank page",
+                "issues": ["Initial screenshot is blank (nothing rendered)"],
+                "unnecessary_elements": [],
+                "ui_improvements": []
+            }, images
         
-        # Load all screenshots
-        images = [PIL.Image.open(p) for p in screenshots]
+        # Drop an after_* frame whose dHash matches the frame right before it (e.g. a
+        # control that did nothing visible). A 9x8 hash of a full page can miss small
+        # changes such as a moved slider thumb, so the last after_* frame is always kept
+        # and omitted frames are reported neutrally rather than as "nothing changed".
+        stems = [Path(path).stem for path in screenshots]
+        last_after = max((k for k, stem in enumerate(stems) if stem.startswith("after_")), default=-1)
+        kept_images, kept_payloads, kept_hashes, duplicate_notes = [], [], [], []
+        prev_hash = None
+        for k, (stem, img, payload) in enumerate(zip(stems, images, payloads)):
+            h = _dhash(img)
+            is_near_dup = prev_hash is not None and bin(h ^ prev_hash).count("1") <= 5
+            prev_hash = h
+            if stem.startswith("after_") and k != last_after and is_near_dup:
+                duplicate_notes.append(f"- Screenshot '{stem}' omitted as a near-duplicate of the previous one")
+                continue
+            kept_images.append(img)
+            kept_payloads.append(payload)
+            kept_hashes.append(h)
+        images = kept_images
         
         # Build prompt
-        interaction_summary = "\n".join(f"- {log}" for log in interaction_log)
+        interaction_summary = "\n".join([f"- {log}" for log in interaction_log] + duplicate_notes)
         
         # Build context section
         context_section = ""
@@ -456,100 +941,72 @@ class ModuleEvaluator:
             context_section += "\n⚠️ IMPORTANT: Consider the pedagogical intent. This step may intentionally omit details that come in later steps.\n"
         
         if component_type == "interactive":
-            prompt = f"""Evaluate this educational component. The screenshots show it before and after interactions.
-
+            rubric = INTERACTIVE_RUBRIC
+            prompt = f"""Interactions performed:
 {interaction_summary}
-
-Rate it 0-100 based on these simple criteria:
-
-1. **Does it work?** (30 pts)
-   - Buttons/sliders respond
-   - Shows visual changes when interacted with
-   - Not broken or crashing
-
-2. **Is it usable?** (30 pts)
-   - Layout makes sense
-   - Clear what to do
-   - Feedback appears when you interact
-
-3. **Looks reasonable?** (20 pts)
-   - Not ugly or confusing
-   - Colors/text are readable
-   - Organized layout
-
-4. **Teaches the concept?** (20 pts)
-   - Helps students understand
-   - Interactive learning happens
-
-**Scoring:**
-- 0-60: Broken (doesn't work)
-- 61-74: Works but poor UX
-- 75+: Good (works, usable, makes sense)
-
-Respond in JSON:
-{{
-    "score": <0-100>,
-    "feedback": "<brief assessment>",
-    "issues": ["<major issue>"],
-    "unnecessary_elements": [],
-    "ui_improvements": []
-}}"""
+{context_section}"""
         else:
-            prompt = f"""Evaluate this SVG diagram. Rate 0-100:
-- Clarity and readability
-- Educational value
-- Visual quality
-
-Respond in JSON:
-{{
-    "score": <0-100>,
-    "feedback": "<brief assessment>",
-    "issues": ["<issue if any>"]
-}}"""
+            rubric = DIAGRAM_RUBRIC
+            prompt = context_section or "Evaluate the diagram in the screenshot."
+        
+        # Reuse a previous verdict for identical inputs
+        cache_key = hashlib.blake2b("\0".join([
+            self._genai_model, rubric, component_type, step_explanation or "", input_label or "",
+            cache_salt, prompt, *(f"{h:016x}" for h in kept_hashes)
+        ]).encode()).hexdigest()
+        cache_path = VERDICT_CACHE_DIR / f"{cache_key}.json"
+        # In-process tier: exact screenshot bytes on top of the perceptual key, so only
+        # byte-identical renders (e.g. a re-queued component that did not change) hit it
+        memory_key = hashlib.blake2b(
+            cache_key.encode() + b"".join(hashlib.blake2b(d).digest() for d in (screenshot_data or []))
+        ).hexdigest()
+        if self.use_cache and memory_key in self._vision_cache:
+            logger.info("♻️  Using in-memory verdict (identical screenshots)")
+            return dict(self._vision_cache[memory_key]), images
+        if self.use_cache:
+            try:
+                if time.time() - cache_path.stat().st_mtime < VERDICT_CACHE_TTL:
+                    logger.info("♻️  Using cached verdict")
+                    return _json_loads(cache_path.read_bytes()), images
+            except (OSError, ValueError):
+                pass
         
-        # Call Gemini (google.genai)
-        content = [prompt] + images
-        response = await asyncio.to_thread(self._call_gemini, content)
+        # Call Gemini (google.genai): static rubric in config, dynamic content last
+        text, result = await self._judge(prompt, kept_payloads, rubric)
         
-        # Parse response
+        # Parse response (schema-constrained, so the whole text is the JSON object)
         try:
-            text = response.text
-            json_match = re.search(r'\{[\s\S]*\}', text)
-            if json_match:
-                result = json.loads(json_match.group(0))
-                # Ensure all fields exist
-                result.setdefault('unnecessary_elements', [])
-                result.setdefault('ui_improvements', [])
-                result.setdefault('issues', [])
-                return result
-            else:
-                return {
-                    "score": 50,
-                    "feedback": text,
-                    "issues": ["Could not parse evaluation"],
-                    "unnecessary_elements": [],
-                    "ui_improvements": []
-                }
+            if result is None:
+                result = _json_loads(text)
+            # Ensure all fields exist
+            result.setdefault('unnecessary_elements', [])
+            result.setdefault('ui_improvements', [])
+            result.setdefault('issues', [])
+            if self.use_cache:
+                await asyncio.to_thread(_write_atomic, cache_path, _json_dumps(result))
+                self._vision_cache[memory_key] = dict(result)
+            return result, images
         except Exception as e:
             logger.error(f"Error parsing Gemini response: {e}")
             return {
                 "score": 50,
-                "feedback": response.text if hasattr(response, 'text') else str(response),
+                "feedback": text,
                 "issues": [f"Parse error: {str(e)}"],
                 "unnecessary_elements": [],
                 "ui_improvements": []
-            }
+            }, images
     
     async def _auto_fix_component(
         self,
         fix_prompt: str,
         current_html: str,
-        screenshots: List[Path] = None
+        screenshots: List[Any] = None
     ) -> str:
-        """Use Gemini to automatically fix the component with visual context"""
+        """Use Gemini to automatically fix the component with visual context.
+        
+        screenshots may be already-decoded PIL images (reused as-is) or file paths.
+        """
         try:
-            import PIL.Image
-            
             # Build content with screenshots for visual context
             content = [fix_prompt]
             
@@ -557,9 +1014,11 @@ Respond in JSON:
             if screenshots:
                 content.append("\n**VISUAL EVIDENCE (Screenshots showing the issues):**")
                 for screenshot in screenshots:
-                    if screenshot.exists():
+                    if not isinstance(screenshot, Path):
+                        content.append(screenshot)
+                    elif screenshot.exists():
                         try:
-                            img = PIL.Image.open(screenshot)
+                            img = await asyncio.to_thread(_load_screenshot, screenshot)
                             content.append(img)
                         except Exception as e:
                             logger.warning(f"Could not load screenshot {screenshot}: {e}")
@@ -570,20 +1029,10 @@ Respond in JSON:
 ```html
 {current_html}
 ```
-
-**CRITICAL INSTRUCTIONS:**
-1. PRESERVE all working interactive elements (sliders, buttons, inputs)
-2. PRESERVE all JavaScript functionality that works
-3. ONLY fix the specific issues mentioned above
-4. If interactions work, do not change the JS logic
-5. Focus on fixing: styling, colors, spacing, feedback text, layout
-6. Keep the component self-contained (inline CSS/JS)
-7. Return COMPLETE working HTML (do not remove anything functional)
-
-Generate the COMPLETE fixed HTML. Return ONLY the HTML code, no explanations.""")
+""" + AUTO_FIX_INSTRUCTIONS)
             
             logger.info("⏳ Waiting for Gemini response...")
-            response = await asyncio.to_thread(self._call_gemini, content)
+            response = await self._call_gemini(content)
             
             # Extract HTML from response
             text = response.text
@@ -596,12 +1045,12 @@ Generate the COMPLETE fixed HTML. Return ONLY the HTML code, no explanations."""
             logger.info("=" * 80)
             
             # Try to extract code block
-            code_match = re.search(r'```html\n([\s\S]*?)\n```', text)
+            code_match = _HTML_BLOCK_RE.search(text)
             if code_match:
                 return code_match.group(1)
             
             # Try without language tag
-            code_match = re.search(r'```\n([\s\S]*?)\n```', text)
+            code_match = _HTML_ANY_RE.search(text)
             if code_match:
                 return code_match.group(1)
             
@@ -717,6 +1166,11 @@ Feedback:
 
 Please fix these issues and regenerate the component."""
     
+    async def _evaluate_bounded(self, **kwargs) -> Dict[str, Any]:
+        """evaluate_component, capped at EVAL_CONCURRENCY in-flight evaluations"""
+        async with self._sem:
+            return await self.evaluate_component(**kwargs)
+    
     async def evaluate_module(
         self,
         module_id: str,
@@ -754,115 +1208,110 @@ Please fix these issues and regenerate the component."""
                 "summary": "Module not found"
             }
         
-        with open(manifest_path) as f:
-            manifest = json.load(f)
+        manifest = self._load_manifest(module_id)
+        
+        # One wall-clock snapshot for naming/reporting; duration comes from the monotonic clock
+        started_at = datetime.now()
+        t0 = time.monotonic()
         
         # Create screenshots directory
-        screenshots_dir = Path(f"evaluation_results/{module_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        screenshots_dir = Path(f"evaluation_results/{module_id}_{started_at.strftime('%Y%m%d_%H%M%S')}")
         screenshots_dir.mkdir(parents=True, exist_ok=True)
         
-        # Handle v2.0 multi-question manifests
+        # Plan every evaluation up front (pure dict building), then run them all at once.
+        # v2.0 (multi-question) steps are flattened across questions.
         step_results = []
-        if manifest.get("version") == "2.0" and "questions" in manifest:
+        multi_question = manifest.get("version") == "2.0" and "questions" in manifest
+        if multi_question:
             logger.info(f"📚 Multi-question module (v2.0) with {len(manifest['questions'])} questions")
-            
-            # Evaluate all questions
-            for q_idx, question_data in enumerate(manifest["questions"]):
-                logger.info(f"\n{'='*70}")
-                logger.info(f"❓ QUESTION {q_idx + 1}: {question_data.get('problem', {}).get('title', 'Untitled')}")
-                logger.info(f"{'='*70}\n")
-                
-                for i, step in enumerate(question_data.get("steps", [])):
+            plan = [
+                dict(
+                    module_id=module_id,
+                    step_index=i,
+                    component_type=step.get("visualizationType", "interactive"),
                     # Build URL for isolated component viewer (v2.0 format)
-                    url = f"{base_url}/module-viewer.html?module={module_id}&question={q_idx}&step={i}"
-                    
-                    # Determine component type
-                    component_type = step.get("visualizationType", "interactive")
-                    
-                    # Extract educational context
-                    step_explanation = step.get("explanation", "")
-                    input_label = step.get("inputLabel", "")
-                    
-                    # Evaluate the component
-                    result = await self.evaluate_component(
-                        module_id=module_id,
-                        step_index=i,
-                        component_type=component_type,
-                        url=url,
-                        screenshots_dir=screenshots_dir / f"q{q_idx+1}_step_{i}",
-                        question_index=q_idx,
-                        module_version="2.0",
-                        step_explanation=step_explanation,
-                        input_label=input_label
-                    )
-                    
-                    result["step_index"] = i
-                    result["question_index"] = q_idx
-                    result["step_title"] = step.get("explanation", "")[:100]
-                    step_results.append(result)
-                    
-                    # Print result
-                    status = "✅ PASSED" if result["passed"] else "❌ NEEDS FIX"
-                    logger.info(f"Q{q_idx+1} Step {i + 1}: {status} (Score: {result['score']}/100)")
-                    
-                    if result["issues"]:
-                        for issue in result["issues"]:
-                            logger.info(f"  ⚠️  {issue}")
+                    url=f"{base_url}/module-viewer.html?module={module_id}&question={q_idx}&step={i}",
+                    screenshots_dir=screenshots_dir / f"q{q_idx+1}_step_{i}",
+                    question_index=q_idx,
+                    module_version="2.0",
+                    step_explanation=step.get("explanation", ""),
+                    input_label=step.get("inputLabel", ""),
+                    create_dir=False
+                )
+                for q_idx, question_data in enumerate(manifest["questions"])
+                for i, step in enumerate(question_data.get("steps", []))
+            ]
         else:
             # Single question (v1.0)
-            logger.info(f"📄 Single-question module (v1.0)")
-            for i, step in enumerate(manifest.get("steps", [])):
-                # Build URL for isolated component viewer
-                url = f"{base_url}/module-viewer.html?module={module_id}&step={i}"
-                
-                # Determine component type
-                component_type = step.get("visualizationType", "interactive")
-                
-                # Extract educational context
-                step_explanation = step.get("explanation", "")
-                input_label = step.get("inputLabel", "")
-                
-                # Evaluate the component
-                result = await self.evaluate_component(
+            logger.info("📄 Single-question module (v1.0)")
+            plan = [
+                dict(
                     module_id=module_id,
                     step_index=i,
-                    component_type=component_type,
-                    url=url,
+                    component_type=step.get("visualizationType", "interactive"),
+                    # Build URL for isolated component viewer
+                    url=f"{base_url}/module-viewer.html?module={module_id}&step={i}",
                     screenshots_dir=screenshots_dir / f"step_{i}",
                     question_index=0,
                     module_version="1.0",
-                    step_explanation=step_explanation,
-                    input_label=input_label
+                    step_explanation=step.get("explanation", ""),
+                    input_label=step.get("inputLabel", ""),
+                    create_dir=False
                 )
-                
-                result["step_index"] = i
-                result["step_title"] = step.get("explanation", "")[:100]
-                step_results.append(result)
-                
-                # Print result
+                for i, step in enumerate(manifest.get("steps", []))
+            ]
+        
+        # Create every step directory up front, overlapping the mkdir round trips
+        # (slow on network filesystems) instead of paying them inside each evaluation.
+        await asyncio.gather(*(
+            asyncio.to_thread(kwargs["screenshots_dir"].mkdir, parents=True, exist_ok=True)
+            for kwargs in plan
+        ))
+        
+        results = await asyncio.gather(*(self._evaluate_bounded(**kwargs) for kwargs in plan))
+        
+        last_q_idx = None
+        total_score = 0
+        passed_count = 0
+        for kwargs, result in zip(plan, results):
+            q_idx, i = kwargs["question_index"], kwargs["step_index"]
+            if multi_question and q_idx != last_q_idx:
+                question_data = manifest["questions"][q_idx]
+                logger.info(f"\n{'='*70}")
+                logger.info(f"❓ QUESTION {q_idx + 1}: {question_data.get('problem', {}).get('title', 'Untitled')}")
+                logger.info(f"{'='*70}\n")
+                last_q_idx = q_idx
+            
+            result["step_index"] = i
+            if multi_question:
+                result["question_index"] = q_idx
+            result["step_title"] = kwargs["step_explanation"][:100]
+            step_results.append(result)
+            total_score += result["score"]
+            passed_count += bool(result["passed"])
+            
+            # Print result (lazy %-formatting; issues go out as one record)
+            if logger.isEnabledFor(logging.INFO):
                 status = "✅ PASSED" if result["passed"] else "❌ NEEDS FIX"
-                logger.info(f"Step {i + 1}: {status} (Score: {result['score']}/100)")
-                
+                if multi_question:
+                    logger.info("Q%d Step %d: %s (Score: %s/100)", q_idx + 1, i + 1, status, result["score"])
+                else:
+                    logger.info("Step %d: %s (Score: %s/100)", i + 1, status, result["score"])
                 if result["issues"]:
-                    for issue in result["issues"]:
-                        logger.info(f"  ⚠️  {issue}")
-        
-        # Calculate overall score
-        if step_results:
-            overall_score = sum(r["score"] for r in step_results) / len(step_results)
-            overall_passed = all(r["passed"] for r in step_results)
-        else:
-            overall_score = 0
-            overall_passed = False
+                    logger.info("  ⚠️  %s", "\n  ⚠️  ".join(result["issues"]))
         
+        # Calculate overall score from the totals tracked in the loop above
+        n_steps = len(step_results)
+        overall_score = total_score / n_steps if n_steps else 0
+        overall_passed = n_steps > 0 and passed_count == n_steps
+
         # Generate summary
-        passed_count = sum(1 for r in step_results if r["passed"])
-        failed_count = len(step_results) - passed_count
+        failed_count = n_steps - passed_count
         
         status_text = '✅ ALL PASSED' if overall_passed else f'❌ {failed_count} NEED FIXING'
         summary = (
             f"Module Evaluation Summary:\n"
-            f"- Total Steps: {len(step_results)}\n"
+            f"- Total Steps: {n_steps}\n"
             f"- Passed: {passed_count}\n"
             f"- Failed: {failed_count}\n"
             f"- Overall Score: {overall_score:.1f}/100\n"
@@ -877,13 +1326,14 @@ Please fix these issues and regenerate the component."""
             "steps": step_results,
             "summary": summary,
             "evaluation_time": datetime.now().isoformat(),
+            "evaluation_started_at": started_at.isoformat(),
+            "evaluation_duration_s": round(time.monotonic() - t0, 2),
             "screenshots_dir": str(screenshots_dir)
         }
         
         # Save results
         results_file = screenshots_dir / "evaluation_results.json"
-        with open(results_file, 'w') as f:
-            json.dump(result, f, indent=2)
+        await asyncio.to_thread(results_file.write_bytes, _json_dumps(result, indent=True))
         
         logger.info(f"\n{summary}\n")
         logger.info(f"📁 Results saved to: {results_file}")
@@ -891,70 +1341,69 @@ Please fix these issues and regenerate the component."""
         return result
     
     async def close(self):
-        """Close browser connection"""
+        """Close browser connection and the shared Gemini client"""
         if self.mcp:
             await self.mcp.close()
+        await _close_genai_client()
 
 
 async def main():
     """CLI interface"""
     if len(sys.argv) < 2:
-        print("Usage: python evaluate_module.py <module-id> [--headless]")
+        print("Usage: python evaluate_module.py <module-id> [--headless] [--no-cache]")
         print("Example: python evaluate_module.py test-001")
         return 1
     
     module_id = sys.argv[1]
     headless = "--headless" in sys.argv
+    use_cache = "--no-cache" not in sys.argv
     
     print(f"\n{'='*70}")
-    print(f"🔬 MODULE EVALUATOR")
+    print("🔬 MODULE EVALUATOR")
     print(f"{'='*70}\n")
     print(f"📦 Module: {module_id}")
     print(f"🌐 Browser: {'Headless' if headless else 'Visible'}")
-    print(f"🤖 Method: Browser automation + Gemini vision")
+    print("🤖 Method: Browser automation + Gemini vision")
     print()
     
-    evaluator = ModuleEvaluator(headless=headless)
+    evaluator = ModuleEvaluator(headless=headless, use_cache=use_cache)
     
     try:
         await evaluator.connect()
         result = await evaluator.evaluate_module(module_id)
         
-        # Print detailed results
-        print(f"\n{'='*70}")
-        print(f"📊 DETAILED RESULTS")
-        print(f"{'='*70}\n")
+        # Print detailed results (built up and written once)
+        parts = [f"\n{'='*70}\n", "📊 DETAILED RESULTS\n", f"{'='*70}\n\n"]
         
         for step_result in result["steps"]:
-            print(f"\n📝 Step {step_result['step_index'] + 1}:")
-            print(f"   Score: {step_result['score']}/100")
-            print(f"   Status: {'✅ PASSED' if step_result['passed'] else '❌ FAILED'}")
+            parts.append(f"\n📝 Step {step_result['step_index'] + 1}:\n")
+            parts.append(f"   Score: {step_result['score']}/100\n")
+            parts.append(f"   Status: {'✅ PASSED' if step_result['passed'] else '❌ FAILED'}\n")
             
             if step_result["issues"]:
-                print(f"   Issues:")
-                for issue in step_result["issues"]:
-                    print(f"      ⚠️  {issue}")
+                parts.append("   Issues:\n")
+                parts.extend(f"      ⚠️  {issue}\n" for issue in step_result["issues"])
             
             if step_result.get("unnecessary_elements"):
-                print(f"   Unnecessary Elements:")
-                for elem in step_result["unnecessary_elements"]:
-                    print(f"      🗑️  {elem}")
+                parts.append("   Unnecessary Elements:\n")
+                parts.extend(f"      🗑️  {elem}\n" for elem in step_result["unnecessary_elements"])
             
             if step_result.get("ui_improvements"):
-                print(f"   UI Improvements:")
-                for imp in step_result["ui_improvements"]:
-                    print(f"      ✨  {imp}")
+                parts.append("   UI Improvements:\n")
+                parts.extend(f"      ✨  {imp}\n" for imp in step_result["ui_improvements"])
             
             if step_result.get("fixed_html"):
-                print(f"   ✅ Auto-fixed version saved!")
+                parts.append("   ✅ Auto-fixed version saved!\n")
             
             if step_result["fix_prompt"] and not step_result.get("fixed_html"):
-                print(f"\n   🔧 FIX PROMPT:")
-                print("   " + "\n   ".join(step_result["fix_prompt"].split("\n")[:10]))
+                parts.append("\n   🔧 FIX PROMPT:\n")
+                parts.append("   " + "\n   ".join(step_result["fix_prompt"].split("\n")[:10]) + "\n")
         
-        print(f"\n{'='*70}")
-        print(result["summary"])
-        print(f"{'='*70}\n")
+        parts.append(f"\n{'='*70}\n")
+        parts.append(result["summary"] + "\n")
+        parts.append(f"{'='*70}\n\n")
+        sys.stdout.write("".join(parts))
+        sys.stdout.flush()
         
         return 0 if result["overall_passed"] else 1
         
@@ -15,12 +15,116 @@ Usage:
 """
 
 import argparse
-import base64
+import io
 import json
+import os
 import sys
-import zipfile
 from pathlib import Path
 
+# zipfile/base64/shutil/concurrent.futures are imported where used: a failed job
+# with no zips in its output never needs them.
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def _b64decode_chunked(b64: str, chunk_size: int = 4 << 20) -> bytes:
+    """base64-decode a large str chunk by chunk.
+
+    base64.b64decode(str) first copies the whole string to ASCII bytes; decoding 4 MiB
+    slices into one BytesIO avoids that transient copy, and getvalue() hands back the
+    buffer without another one.
+    """
+    import base64
+    import binascii
+    if len(b64) % 4 or "\n" in b64:
+        return base64.b64decode(b64)
+    buf = io.BytesIO()
+    for i in range(0, len(b64), chunk_size):
+        buf.write(binascii.a2b_base64(b64[i:i + chunk_size]))
+    return buf.getvalue()
+
+
+COPY_BUFFER_SIZE = 1 << 20  # ZipFile.extract copies in small chunks; the webm recording is MBs
+
+
+def _is_plain_member(name: str) -> bool:
+    """True for relative member paths that need none of ZipFile.extract's sanitizing."""
+    return not os.path.isabs(name) and ".." not in Path(name).parts and "\\" not in name
+
+
+def _extract_members(raw: bytes, names: list, dest: Path):
+    """Extract names from the zip in raw; each worker gets its own ZipFile handle."""
+    import shutil
+    import zipfile
+    with zipfile.ZipFile(io.BytesIO(raw), "r") as zf:
+        for name in names:
+            if not _is_plain_member(name):
+                zf.extract(name, dest)
+            elif name.endswith("/"):
+                (dest / name).mkdir(parents=True, exist_ok=True)
+            else:
+                target = dest / name
+                target.parent.mkdir(parents=True, exist_ok=True)
+                with zf.open(name) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+
+
+def extract_b64_zip(b64: str, dest: Path):
+    """Decode a base64 zip in memory and extract it under dest (no temporary .zip on disk).
+
+    Members are written by a thread pool; zip decompression and file writes release the GIL.
+    """
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor
+    raw = _b64decode_chunked(b64)
+    with zipfile.ZipFile(io.BytesIO(raw), "r") as zf:
+        names = zf.namelist()
+    workers = min(32, (os.cpu_count() or 1) * 4, len(names))
+    if workers <= 1:
+        _extract_members(raw, names, dest)
+        return
+    # Create parent dirs up front: ZipFile.extract's exists-then-makedirs races across threads
+    for name in names:
+        parent = os.path.dirname(name)
+        if parent and _is_plain_member(parent):
+            (dest / parent).mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(lambda i: _extract_members(raw, names[i::workers], dest), range(workers)))
+
+
+def _extract_module(out: dict, base: Path, module_id: str):
+    """Section 1: module zip. Returns (extracted, [(message, to_stderr)])."""
+    if "module_zip_base64" in out and "module_zip_filename" in out:
+        extract_b64_zip(out.pop("module_zip_base64"), base)  # pop: drop the big str once decoded
+        return True, [(f"Module: {out['module_zip_filename']} -> extracted under {base}", False)]
+    reason = out.get("module_zip_skipped") or "module may be too large"
+    return False, [
+        (f"No module zip in output: {reason}", True),
+        ("  To get the module: run the job with user_id/lesson_id to push to Supabase, then pull_from_supabase.py; or run with fewer problem_texts so the zip fits.", True),
+    ]
+
+
+def _write_eval_json(out: dict, base: Path, module_id: str):
+    """Section 2: evaluation results JSON."""
+    if "evaluation_results_json" not in out:
+        return False, []
+    eval_dir = base / "evaluation_results" / f"{module_id}_queue"
+    eval_dir.mkdir(parents=True, exist_ok=True)
+    (eval_dir / "evaluation_results.json").write_text(out["evaluation_results_json"])
+    return True, [(f"Evaluation results: {eval_dir / 'evaluation_results.json'}", False)]
+
+
+def _extract_artifacts(out: dict, base: Path, module_id: str):
+    """Section 3: artifacts zip (screenshots + recording)."""
+    if "artifacts_zip_base64" in out and "artifacts_zip_filename" in out:
+        extract_b64_zip(out.pop("artifacts_zip_base64"), base)
+        return True, [(f"Artifacts (screenshots + recording): {out['artifacts_zip_filename']} -> extracted under {base}", False)]
+    return False, [("No artifacts_zip_base64 in output", True)]
+
 
 def main():
     ap = argparse.ArgumentParser(description="Extract module and artifacts from RunPod job output")
@@ -28,11 +132,13 @@ def main():
     ap.add_argument("--out", "-o", default=".", help="Output directory (default: current dir)")
     args = ap.parse_args()
 
+    # Read raw bytes: orjson parses them directly (no separate UTF-8 decode pass)
     if args.input == "-":
-        data = json.load(sys.stdin)
+        raw = sys.stdin.buffer.read()
     else:
-        with open(args.input) as f:
-            data = json.load(f)
+        raw = Path(args.input).read_bytes()
+    data = orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+    del raw
 
     # RunPod status response has output in data["output"]
     if "output" in data:
@@ -48,38 +154,18 @@ def main():
     base = Path(args.out)
     base.mkdir(parents=True, exist_ok=True)
 
-    # 1. Module zip
-    module_extracted = False
-    if "module_zip_base64" in out and "module_zip_filename" in out:
-        zip_path = base / out["module_zip_filename"]
-        zip_path.write_bytes(base64.b64decode(out["module_zip_base64"]))
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            zf.extractall(base)
-        print(f"Module: {zip_path} -> extracted under {base}")
-        zip_path.unlink()  # remove zip after extract
-        module_extracted = True
-    else:
-        reason = out.get("module_zip_skipped") or "module may be too large"
-        print(f"No module zip in output: {reason}", file=sys.stderr)
-        print("  To get the module: run the job with user_id/lesson_id to push to Supabase, then pull_from_supabase.py; or run with fewer problem_texts so the zip fits.", file=sys.stderr)
-
-    # 2. Evaluation results JSON
-    if "evaluation_results_json" in out:
-        eval_dir = base / "evaluation_results" / f"{module_id}_queue"
-        eval_dir.mkdir(parents=True, exist_ok=True)
-        (eval_dir / "evaluation_results.json").write_text(out["evaluation_results_json"])
-        print(f"Evaluation results: {eval_dir / 'evaluation_results.json'}")
-
-    # 3. Artifacts zip (screenshots + recording)
-    if "artifacts_zip_base64" in out and "artifacts_zip_filename" in out:
-        zip_path = base / out["artifacts_zip_filename"]
-        zip_path.write_bytes(base64.b64decode(out["artifacts_zip_base64"]))
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            zf.extractall(base)
-        print(f"Artifacts (screenshots + recording): {zip_path} -> extracted under {base}")
-        zip_path.unlink()
-    else:
-        print("No artifacts_zip_base64 in output", file=sys.stderr)
+    # The three sections are independent: run them concurrently and print their
+    # messages in order once all have finished.
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        futs = [ex.submit(fn, out, base, module_id)
+                for fn in (_extract_module, _write_eval_json, _extract_artifacts)]
+        sections = [f.result() for f in futs]
+    module_extracted = sections[0][0]
+    artifacts_extracted = sections[2][0]
+    for _, messages in sections:
+        for msg, to_stderr in messages:
+            print(msg, file=sys.stderr if to_stderr else sys.stdout)
 
     print()
     if module_extracted:
@@ -89,7 +175,7 @@ def main():
         print(f"Done (no module zip). module_id: {module_id}")
         print("  Evaluation results and artifacts (if any) were extracted. Module was not included (too large).")
     rec_path = base / "recordings" / module_id / "evaluation.webm"
-    if rec_path.exists() or "artifacts_zip_base64" in out:
+    if rec_path.exists() or artifacts_extracted:
         print(f"  Recording: {rec_path}")
 
     if out.get("status") == "failed":
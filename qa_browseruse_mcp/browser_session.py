@@ -198,8 +198,9 @@ class BrowserSession:
             logger.error(f"Set viewport failed: {e}")
             return SimpleResponse(success=False, error=str(e))
     
-    async def screenshot(self, path: Optional[str] = None, return_base64: bool = False, timeout: Optional[Union[int, float]] = None) -> SimpleResponse:
-        """Take a screenshot"""
+    async def screenshot(self, path: Optional[str] = None, return_base64: bool = False, timeout: Optional[Union[int, float]] = None,
+                         image_type: str = "png", quality: Optional[int] = None) -> SimpleResponse:
+        """Take a screenshot (image_type "png" or "jpeg"; quality applies to jpeg only)"""
         try:
             if not self.page:
                 await self.start()
@@ -214,11 +215,16 @@ class BrowserSession:
             
             # Use provided timeout or default to 90s for complex pages
             screenshot_timeout = int(timeout * 1000) if timeout is not None else 90000
+            screenshot_kwargs = {}
+            if image_type == "jpeg" and quality is not None:
+                screenshot_kwargs["quality"] = quality
             screenshot_bytes = await self.page.screenshot(
                 path=path,
+                type=image_type,
                 full_page=True,
                 timeout=screenshot_timeout,
-                animations="disabled"
+                animations="disabled",
+                **screenshot_kwargs
             )
             
             if return_base64:
@@ -77,7 +77,12 @@ class BrowserUseMCPClient:
             elif tool == "set_viewport":
                 result = await self._browser_session.set_viewport(args.get("width", 1440), args.get("height", 900))
             elif tool == "screenshot":
-                result = await self._browser_session.screenshot(path=args.get("path"), return_base64=args.get("return_base64", False))
+                result = await self._browser_session.screenshot(
+                    path=args.get("path"),
+                    return_base64=args.get("return_base64", False),
+                    image_type=args.get("type", "png"),
+                    quality=args.get("quality")
+                )
             elif tool == "dom_snapshot":
                 result = await self._browser_session.dom_snapshot(max_interactive=args.get("max_interactive", 50))
             elif tool == "click":
@@ -92,7 +92,12 @@ async def call_tool(req: ToolRequest):
         elif tool == "screenshot":
             path = args.get("path")
             return_base64 = args.get("return_base64", False)
-            result = await browser_session.screenshot(path=path, return_base64=return_base64)
+            result = await browser_session.screenshot(
+                path=path,
+                return_base64=return_base64,
+                image_type=args.get("type", "png"),
+                quality=args.get("quality")
+            )
             return result.model_dump()
         
         elif tool == "dom_snapshot":
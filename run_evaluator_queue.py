@@ -4,6 +4,7 @@ Queue-based evaluator runner with async fixes
 """
 
 import asyncio
+import os
 import sys
 from pathlib import Path
 from collections import deque
@@ -14,6 +15,10 @@ from datetime import datetime
 # Add current directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
+# Components evaluated back-to-back: the next one's browser work overlaps the
+# current one's Gemini call
+EVAL_PIPELINE_DEPTH = int(os.environ.get("EVAL_PIPELINE_DEPTH", "2"))
+
 class ComponentTask:
     """Represents a component to evaluate"""
     def __init__(self, module_id: str, question_index: int, step_index: int, 
@@ -108,11 +113,54 @@ async def apply_fix(module_id: str, question_index: int, step_index: int,
             logger.info(f"  FIXER: Restored from backup")
         return False
 
-async def run_evaluation(module_id: str):
+async def evaluate_task(evaluator, task: ComponentTask, module_version: str):
+    """Evaluate one queued component, reconnecting the browser once if it crashed."""
+    from evaluate_loop_clean import logger
+    
+    # Build URL
+    url = f"http://localhost:8000/module-viewer.html?module={task.module_id}"
+    url += f"&question={task.question_index}&step={task.step_index}"
+    
+    # Evaluate component
+    screenshots_dir = Path(f"evaluation_results/{task.module_id}_queue") / f"q{task.question_index+1}_step_{task.step_index}"
+    
+    # Try evaluation with browser reconnection on failure
+    max_retries = 2
+    for retry in range(max_retries):
+        try:
+            return await evaluator.evaluate_component(
+                module_id=task.module_id,
+                step_index=task.step_index,
+                component_type=task.component_type,
+                url=url,
+                screenshots_dir=screenshots_dir,
+                question_index=task.question_index,
+                module_version=module_version,
+                step_explanation=None,
+                input_label=None
+            )
+        except Exception as e:
+            error_msg = str(e).lower()
+            if "browser closed" in error_msg or "page has been closed" in error_msg:
+                if retry < max_retries - 1:
+                    logger.warning(f"⚠️  Browser crashed, reconnecting... (retry {retry+1}/{max_retries})")
+                    await evaluator.connect()
+                    await asyncio.sleep(2)
+                    continue
+            # Re-raise if not browser issue or out of retries
+            raise
+    return None
+
+async def run_evaluation(module_id: str, manifest_ready=None, generation_failed=None):
     """Run evaluator with async queue-based fixing
     
     Args:
         module_id: The module ID to evaluate
+        manifest_ready: Optional threading.Event set once the module's manifest is
+            written. The browser connects first, then this waits for it, so a caller
+            still generating the module overlaps browser startup with generation.
+        generation_failed: Optional threading.Event set (before manifest_ready) when
+            generation raised; the browser is closed and nothing is evaluated.
     """
     print(f"🔍 Evaluating module: {module_id}", flush=True)
     print(f"🚀 Using async queue-based evaluation\n", flush=True)
@@ -137,6 +185,16 @@ async def run_evaluation(module_id: str):
         raise
 
     try:
+        if manifest_ready is not None:
+            print("⏳ Browser ready; waiting for module generation to finish...", flush=True)
+            # Polled from the event loop: a worker thread parked in wait() would block
+            # interpreter shutdown if the event were never set
+            while not manifest_ready.wait(0):
+                await asyncio.sleep(0.2)
+            if generation_failed is not None and generation_failed.is_set():
+                print("⏹️  Module generation failed; skipping evaluation", flush=True)
+                return
+
         # Start screen recording so we can see what the browser sees
         recording_path.parent.mkdir(parents=True, exist_ok=True)
         if await evaluator.start_recording(str(recording_path)):
@@ -201,7 +259,9 @@ async def run_evaluation(module_id: str):
             except Exception as e:
                 logger.warning(f"Could not load previous results: {e}")
         
-        while queue or fixing_tasks:
+        in_flight = deque()  # (task, asyncio.Task) evaluations started, oldest first
+        
+        while queue or in_flight or fixing_tasks:
             # Check for completed fixes
             completed_fixes = []
             for task_id, (task, fix_future, html, result) in list(fixing_tasks.items()):
@@ -229,8 +289,10 @@ async def run_evaluation(module_id: str):
             for task_id in completed_fixes:
                 del fixing_tasks[task_id]
             
-            # Process next item in queue
-            if queue:
+            # Keep up to EVAL_PIPELINE_DEPTH evaluations in flight: while one waits on
+            # Gemini the next can already be driving the browser (evaluate_component
+            # serializes browser work internally).
+            while queue and len(in_flight) < EVAL_PIPELINE_DEPTH:
                 task = queue.popleft()
                 
                 # Skip if already passed
@@ -246,43 +308,17 @@ async def run_evaluation(module_id: str):
                 if task.attempt > 1:
                     logger.info(f"FIXER: Re-evaluating {task} after previous fix (attempt {task.attempt}/{task.max_attempts})")
                 
-                # Build URL
-                url = f"http://localhost:8000/module-viewer.html?module={task.module_id}"
-                url += f"&question={task.question_index}&step={task.step_index}"
-                
-                # Evaluate component
-                screenshots_dir = Path(f"evaluation_results/{task.module_id}_queue") / f"q{task.question_index+1}_step_{task.step_index}"
-                
-                # Try evaluation with browser reconnection on failure
-                max_retries = 2
-                result = None
-                for retry in range(max_retries):
-                    try:
-                        result = await evaluator.evaluate_component(
-                            module_id=task.module_id,
-                            step_index=task.step_index,
-                            component_type=task.component_type,
-                            url=url,
-                            screenshots_dir=screenshots_dir,
-                            question_index=task.question_index,
-                            module_version=module_version,
-                            step_explanation=None,
-                            input_label=None
-                        )
-                        break  # Success!
-                    except Exception as e:
-                        error_msg = str(e).lower()
-                        if "browser closed" in error_msg or "page has been closed" in error_msg:
-                            if retry < max_retries - 1:
-                                logger.warning(f"⚠️  Browser crashed, reconnecting... (retry {retry+1}/{max_retries})")
-                                await evaluator.connect()
-                                await asyncio.sleep(2)
-                                continue
-                        # Re-raise if not browser issue or out of retries
-                        raise
+                in_flight.append((task, asyncio.create_task(
+                    evaluate_task(evaluator, task, module_version)
+                )))
+            
+            # Handle the oldest in-flight evaluation
+            if in_flight:
+                task, eval_future = in_flight.popleft()
+                result = await eval_future
                 
                 if not result:
-                    logger.error(f"❌ Failed to evaluate {task} after {max_retries} retries")
+                    logger.error(f"❌ Failed to evaluate {task}")
                     continue
                 
                 # Print result
@@ -368,7 +404,7 @@ async def run_evaluation(module_id: str):
                             logger.error(f"  ❌ Component file not found: {component_path}")
             
             # Brief pause if queue is empty but fixes are pending
-            if not queue and fixing_tasks:
+            if not queue and not in_flight and fixing_tasks:
                 pending = [str(t) for t, _, _, _ in fixing_tasks.values()]
                 print(f"\n⏳ Waiting for {len(fixing_tasks)} fix(es) to complete: {', '.join(pending)}")
                 logger.info(f"  FIXER: Waiting for Gemini to finish: {', '.join(pending)}")
@@ -409,8 +445,7 @@ async def run_evaluation(module_id: str):
             "failed_components": failed_components
         }
         
-        with open(results_file, 'w') as f:
-            json.dump(results_data, f, indent=2)
+        await asyncio.to_thread(results_file.write_text, json.dumps(results_data, indent=2))
         
         logger.info(f"📁 Results saved to: {results_file}")
         